@@ -6,12 +6,21 @@ User-friendly interface for emotion prediction
 import streamlit as st
 import requests
 import json
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
+from requests.adapters import HTTPAdapter
 import time
 
 # Configuration
 BACKEND_URL = "http://localhost:8000"  # Change to ngrok URL if using tunneling
 
+# Shared session with keep-alive so repeated calls reuse the same
+# TCP connection instead of paying a handshake each time
+SESSION = requests.Session()
+_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4)
+SESSION.mount("http://", _adapter)
+SESSION.mount("https://", _adapter)
+
 # Page configuration
 st.set_page_config(
     page_title="Voice Emotion Detection",
@@ -57,7 +66,7 @@ st.markdown("""
 def check_backend_health():
     """Check if backend is running"""
     try:
-        response = requests.get(f"{BACKEND_URL}/", timeout=2)
+        response = SESSION.get(f"{BACKEND_URL}/", timeout=2)
         return response.status_code == 200
     except:
         return False
@@ -66,7 +75,7 @@ def check_backend_health():
 def get_supported_emotions():
     """Get list of supported emotions from backend"""
     try:
-        response = requests.get(f"{BACKEND_URL}/emotions", timeout=2)
+        response = SESSION.get(f"{BACKEND_URL}/emotions", timeout=2)
         if response.status_code == 200:
             return response.json()["emotions"]
         return []
@@ -78,7 +87,7 @@ def predict_emotion(audio_file):
     """Send audio file to backend for prediction"""
     try:
         files = {"file": ("audio.wav", audio_file, "audio/wav")}
-        response = requests.post(
+        response = SESSION.post(
             f"{BACKEND_URL}/predict",
             files=files,
             timeout=30
@@ -93,34 +102,38 @@ def predict_emotion(audio_file):
         return None
 
 
+# Emotion display maps (module constants - built once, not per lookup)
+EMOJI_MAP = {
+    "happy": "😊",
+    "sad": "😢",
+    "angry": "😠",
+    "fearful": "😨",
+    "disgust": "🤢",
+    "surprised": "😲",
+    "neutral": "😐",
+    "calm": "😌"
+}
+
+COLOR_MAP = {
+    "happy": "#FFD700",
+    "sad": "#4682B4",
+    "angry": "#DC143C",
+    "fearful": "#9370DB",
+    "disgust": "#8B4513",
+    "surprised": "#FF69B4",
+    "neutral": "#A9A9A9",
+    "calm": "#87CEEB"
+}
+
+
 def get_emotion_emoji(emotion):
     """Map emotion to emoji"""
-    emoji_map = {
-        "happy": "😊",
-        "sad": "😢",
-        "angry": "😠",
-        "fearful": "😨",
-        "disgust": "🤢",
-        "surprised": "😲",
-        "neutral": "😐",
-        "calm": "😌"
-    }
-    return emoji_map.get(emotion.lower(), "🎭")
+    return EMOJI_MAP.get(emotion.lower(), "🎭")
 
 
 def get_emotion_color(emotion):
     """Map emotion to color"""
-    color_map = {
-        "happy": "#FFD700",
-        "sad": "#4682B4",
-        "angry": "#DC143C",
-        "fearful": "#9370DB",
-        "disgust": "#8B4513",
-        "surprised": "#FF69B4",
-        "neutral": "#A9A9A9",
-        "calm": "#87CEEB"
-    }
-    return color_map.get(emotion.lower(), "#808080")
+    return COLOR_MAP.get(emotion.lower(), "#808080")
 
 
 # Main app
@@ -130,14 +143,19 @@ def main():
     st.markdown('<p class="sub-header">Upload an audio file to detect the emotion in the voice</p>',
                 unsafe_allow_html=True)
 
-    # Check backend status
+    # Check backend status - fire both sidebar calls concurrently so the
+    # page load pays one round-trip instead of two
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        health_future = pool.submit(check_backend_health)
+        emotions_future = pool.submit(get_supported_emotions)
+
     with st.sidebar:
         st.header("ℹ️ Information")
 
-        backend_status = check_backend_health()
+        backend_status = health_future.result()
         if backend_status:
             st.success("✅ Backend connected")
-            emotions = get_supported_emotions()
+            emotions = emotions_future.result()
             if emotions:
                 st.write("**Supported Emotions:**")
                 for emotion in emotions: